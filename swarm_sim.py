@@ -1,6 +1,9 @@
 import pygame
 import random
 import math
+import collections
+import functools
+import itertools
 
 pygame.init()
 
@@ -12,9 +15,21 @@ BOID_RADIUS = 6
 MAX_SPEED = 2
 NEIGHBOR_RADIUS = 50
 AVOID_RADIUS = 20
+FIRING_RANGE = 200        # Range within which a boid can fire
+DETECTION_RANGE = 300     # Range within which a boid can detect enemies
 FORMATION_MODE = 'V'      # Can be 'V' or 'CIRCLE'
 FONT = pygame.font.SysFont("Arial", 14)
 
+# Squared thresholds, so proximity checks can skip the square root
+NEIGHBOR_RADIUS_SQ = NEIGHBOR_RADIUS ** 2
+AVOID_RADIUS_SQ = AVOID_RADIUS ** 2
+FIRING_RANGE_SQ = FIRING_RANGE ** 2
+DETECTION_RANGE_SQ = DETECTION_RANGE ** 2
+HEAL_RADIUS_SQ = 60 ** 2
+WAYPOINT_SQ = 10 ** 2
+MAX_SPEED_SQ = MAX_SPEED ** 2
+CLICK_RADIUS_SQ = (BOID_RADIUS * 2) ** 2
+
 # Colors
 WHITE = (255, 255, 255)
 GRAY = (180, 180, 180)
@@ -31,24 +46,89 @@ screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Advanced Drone Squad Simulation")
 
 # --- Utility Functions ---
-def distance(a, b):
-    """Calculates the Euclidean distance between two points."""
-    return math.hypot(a[0] - b[0], a[1] - b[1])
-
+def wrap_delta(a, b, size):
+    """Returns a - b along one axis of the wrapping field, taking the shorter way around."""
+    d = a - b
+    if d > size / 2:
+        return d - size
+    if d < -size / 2:
+        return d + size
+    return d
+
+def dist_sq(a, b):
+    """Calculates the squared Euclidean distance between two points on the wrapping field."""
+    dx = wrap_delta(a[0], b[0], WIDTH)
+    dy = wrap_delta(a[1], b[1], HEIGHT)
+    return dx * dx + dy * dy
+
+@functools.lru_cache(maxsize=None)
 def get_formation_offset(index, mode, total):
-    """Calculates the offset for a boid in a given formation."""
+    """Calculates the offset for a boid in a given formation (cached, so returns a tuple)."""
     spacing = 30
     if mode == 'V':
         # V-formation: layer by layer, alternating sides
         layer = (index + 1) // 2
         side = -1 if index % 2 == 0 else 1
-        return [side * spacing * layer, spacing * layer]
+        return (side * spacing * layer, spacing * layer)
     elif mode == 'CIRCLE':
         # Circular formation
         angle = (2 * math.pi / total) * index
         radius = 60
-        return [math.cos(angle) * radius, math.sin(angle) * radius]
-    return [0, 0] # Default if mode is not recognized
+        return (math.cos(angle) * radius, math.sin(angle) * radius)
+    return (0, 0) # Default if mode is not recognized
+
+_LABEL_CACHE = {}
+
+def render_label(text):
+    """Returns the rendered surface for a boid label, rendering each distinct text only once."""
+    surf = _LABEL_CACHE.get(text)
+    if surf is None:
+        surf = _LABEL_CACHE[text] = FONT.render(text, True, WHITE)
+    return surf
+
+GRID_COLS = -(-WIDTH // NEIGHBOR_RADIUS)  # Grid dimensions (ceil), used to wrap cell lookups
+GRID_ROWS = -(-HEIGHT // NEIGHBOR_RADIUS)
+
+def grid_cell(pos):
+    """Returns the spatial grid cell (NEIGHBOR_RADIUS-sized) containing a point."""
+    # Wrapped, since float `%` can return the modulus itself (e.g. a tiny negative x wraps to exactly WIDTH)
+    return ((int(pos[0]) // NEIGHBOR_RADIUS) % GRID_COLS, (int(pos[1]) // NEIGHBOR_RADIUS) % GRID_ROWS)
+
+def nearby(grid, pos, ring=1):
+    """Yields the boids in the grid cells within `ring` cells of pos (3x3 block by default), wrapping at the edges."""
+    cx, cy = grid_cell(pos)
+    cols = [(cx + d) % GRID_COLS for d in range(-ring, ring + 1)]
+    rows = [(cy + d) % GRID_ROWS for d in range(-ring, ring + 1)]
+    for gx in cols:
+        for gy in rows:
+            cell = grid.get((gx, gy))
+            if cell:
+                yield from cell
+
+# --- Pre-rendered Sprites ---
+# Circles are rasterized once here and blitted each frame instead of redrawn
+def _make_circle(color, radius, width=0):
+    """Creates a per-pixel-alpha surface holding a circle centered at (radius, radius)."""
+    surf = pygame.Surface((radius * 2 + 1, radius * 2 + 1), pygame.SRCALPHA)
+    pygame.draw.circle(surf, color, (radius, radius), radius, width)
+    return surf
+
+def _make_cross(color, half):
+    """Creates a per-pixel-alpha surface holding a plus sign (the medic marker)."""
+    surf = pygame.Surface((half * 2 + 1, half * 2 + 1), pygame.SRCALPHA)
+    pygame.draw.line(surf, color, (0, half), (half * 2, half), 1)
+    pygame.draw.line(surf, color, (half, 0), (half, half * 2), 1)
+    return surf
+
+BODY_SURFS = {c: _make_circle(c, BOID_RADIUS) for c in COLORS + [PURPLE, YELLOW]}
+LEADER_RING = _make_circle(WHITE, BOID_RADIUS + 2, 1)
+SHIELD_RING = _make_circle(BLUE, BOID_RADIUS + 4, 1)
+ENGAGE_RING = _make_circle(ORANGE, BOID_RADIUS + 6, 1)
+MEDIC_CROSS = _make_cross(WHITE, 5)
+PROJECTILE_SURF = _make_circle(YELLOW, 3)
+HEALTH_BAR_LENGTH = 30
+RED_BAR = pygame.Surface((HEALTH_BAR_LENGTH, 4))
+RED_BAR.fill(RED)
 
 # --- Ping Class (for communication visualization) ---
 class Ping:
@@ -66,7 +146,8 @@ class Ping:
 
     def draw(self, screen):
         if self.active:
-            pygame.draw.circle(screen, GRAY, (int(self.pos[0]), int(self.pos[1])), int(self.radius), 1)
+            return pygame.draw.circle(screen, GRAY, (int(self.pos[0]), int(self.pos[1])), int(self.radius), 1)
+        return None
 
 # --- Projectile Class (for combat) ---
 class Projectile:
@@ -83,28 +164,37 @@ class Projectile:
             return
 
         # Aim towards the current position of the target
-        dx, dy = self.target_boid.position[0] - self.pos[0], self.target_boid.position[1] - self.pos[1]
-        dist = distance(self.pos, self.target_boid.position)
+        dx = wrap_delta(self.target_boid.position[0], self.pos[0], WIDTH)
+        dy = wrap_delta(self.target_boid.position[1], self.pos[1], HEIGHT)
+        dist = math.sqrt(dx * dx + dy * dy)
         if dist > 0:
-            self.velocity = [dx / dist * self.speed, dy / dist * self.speed]
+            step = self.speed / dist
+            self.velocity[0] = dx * step
+            self.velocity[1] = dy * step
+            remaining = abs(dist - self.speed)
         else:
-            self.velocity = [0, 0] # Stop if on top of target
+            self.velocity[0] = self.velocity[1] = 0 # Stop if on top of target
+            remaining = 0
 
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
+        self.pos[0] = (self.pos[0] + self.velocity[0]) % WIDTH
+        self.pos[1] = (self.pos[1] + self.velocity[1]) % HEIGHT
 
-        # Check for collision with the target
-        if distance(self.pos, self.target_boid.position) < BOID_RADIUS:
+        # Check for collision with the target. The projectile moved straight at it,
+        # so the remaining distance follows from dist and needs no recomputation
+        if remaining < BOID_RADIUS:
             if not self.target_boid.shielded:
                 self.target_boid.health -= 5 # Apply damage if not shielded
             self.active = False # Deactivate after hitting
 
     def draw(self, screen):
         if self.active:
-            pygame.draw.circle(screen, YELLOW, (int(self.pos[0]), int(self.pos[1])), 3)
+            return screen.blit(PROJECTILE_SURF, (int(self.pos[0]) - 3, int(self.pos[1]) - 3))
+        return None
 
 # --- Boid Class (main drone entity) ---
 class Boid:
+    _spawn_counter = itertools.count() # Numbers boids in creation order
+
     def __init__(self, x, y, squad_id, is_leader=False, index=0, is_enemy=False):
         self.position = [x, y]
         self.velocity = [random.uniform(-1, 1), random.uniform(-1, 1)]
@@ -112,7 +202,7 @@ class Boid:
         self.is_leader = is_leader
         self.index_in_squad = index
         self.leader_ref = None          # Reference to its leader Boid object
-        self.formation_offset = [0, 0]
+        self.formation_offset = (0, 0)
         self.label = f"L{index+1}" if is_leader else f"F{index+1}" # Label for display
         self.waypoints = []             # List of patrol points for leaders
         self.current_wp = 0
@@ -124,21 +214,20 @@ class Boid:
         self.shield_timer = 0           # Timer for shield duration
         self.projectile_cooldown = 0    # Cooldown for firing projectiles
         self.is_enemy = is_enemy        # Flag to distinguish enemies from player drones
-        self.firing_range = 200         # Range within which boid can fire
-        self.detection_range = 300      # Range within which boid can detect enemies
         self.state = 'PATROL'           # Initial state for AI ('PATROL', 'ENGAGE', 'EVADE')
+        self.flock_parity = next(Boid._spawn_counter) & 1 # Frame parity this boid flocks on (staggered updates)
 
     def add_waypoint(self, pos):
         """Adds a waypoint to the boid's patrol path."""
         self.waypoints.append(pos)
 
-    def heal_ally(self, all_boids):
+    def heal_ally(self, grid):
         """Medics heal nearby allies in their own squad."""
         if self.is_medic:
             # Filter allies to only include drones from the same squad (and not itself)
-            squad_allies = [b for b in all_boids if b.squad_id == self.squad_id and b != self and not b.is_enemy]
+            squad_allies = [b for b in nearby(grid, self.position, 2) if b.squad_id == self.squad_id and b != self and not b.is_enemy]
             for ally in squad_allies:
-                if distance(self.position, ally.position) < 60 and ally.health < 100:
+                if dist_sq(self.position, ally.position) < HEAL_RADIUS_SQ and ally.health < 100:
                     ally.health += 0.2 # Small healing amount
                     if ally.health > 100:
                         ally.health = 100
@@ -153,8 +242,9 @@ class Boid:
                 ally.shield_timer = 180 # Shield lasts for 3 seconds (60 FPS * 3)
             self.shield_timer = 600 # Leader's cooldown for next shield activation (10 seconds)
 
-    def update(self, all_boids, squad_size):
-        """Updates the boid's state and position."""
+    def update(self, grid, squad_size, player_alive, enemy_alive, flock=True):
+        """Updates the boid's state and position. With flock=False the neighbor scan is
+        skipped for this frame (see the staggering in step_simulation)."""
         if self.health <= 0:
             return # Dead boids don't update
 
@@ -167,61 +257,81 @@ class Boid:
             self.shielded = False # Shield expires
 
         # --- State Machine Logic ---
+        enemies = enemy_alive if not self.is_enemy else player_alive
         if self.state == 'PATROL':
-            self.handle_patrol(all_boids, squad_size)
+            self.handle_patrol(enemies, squad_size)
         elif self.state == 'ENGAGE':
-            self.handle_engage(all_boids)
+            self.handle_engage()
         elif self.state == 'EVADE':
-            self.handle_evade(all_boids)
+            self.handle_evade(enemies)
         # Add more states as needed (e.g., 'REGROUP', 'HEAL_MODE')
 
         # --- Flocking Behaviors (applied generally) ---
         # Cohesion, Alignment, Separation
-        neighbors = [b for b in all_boids if b != self and distance(self.position, b.position) < NEIGHBOR_RADIUS]
-        if neighbors:
+        # Sums for all three are gathered in one pass over the 3x3 block of
+        # grid cells around this boid (the only cells that can hold neighbors).
+        # Own position/velocity are kept in locals until written back at the end.
+        # Offsets wrap around the screen edges, so flocks can hold together across them
+        px, py = self.position
+        vx, vy = self.velocity
+        sx = sy = svx = svy = spx = spy = 0.0
+        n = 0
+        for b in (nearby(grid, self.position) if flock else ()):
+            if b is self:
+                continue
+            bpx, bpy = b.position
+            dx, dy = wrap_delta(px, bpx, WIDTH), wrap_delta(py, bpy, HEIGHT)
+            d2 = dx * dx + dy * dy
+            if d2 >= NEIGHBOR_RADIUS_SQ:
+                continue
+            n += 1
+            sx -= dx # Sum of offsets towards neighbors
+            sy -= dy
+            bvx, bvy = b.velocity
+            svx += bvx
+            svy += bvy
+            if d2 < AVOID_RADIUS_SQ: # Reuses the neighbor distance for separation
+                spx += dx
+                spy += dy
+        if n:
             # Cohesion: move towards average position of neighbors
-            avg_pos = [sum(b.position[0] for b in neighbors) / len(neighbors),
-                       sum(b.position[1] for b in neighbors) / len(neighbors)]
-            self.velocity[0] += 0.01 * (avg_pos[0] - self.position[0])
-            self.velocity[1] += 0.01 * (avg_pos[1] - self.position[1])
+            vx += 0.01 * sx / n
+            vy += 0.01 * sy / n
 
             # Alignment: steer towards average heading of neighbors
-            avg_vel = [sum(b.velocity[0] for b in neighbors) / len(neighbors),
-                       sum(b.velocity[1] for b in neighbors) / len(neighbors)]
-            self.velocity[0] += 0.05 * (avg_vel[0] - self.velocity[0])
-            self.velocity[1] += 0.05 * (avg_vel[1] - self.velocity[1])
+            vx += 0.05 * (svx / n - vx)
+            vy += 0.05 * (svy / n - vy)
 
             # Separation: avoid crowding neighbors
-            for b in neighbors:
-                if distance(self.position, b.position) < AVOID_RADIUS:
-                    self.velocity[0] += (self.position[0] - b.position[0]) * 0.05
-                    self.velocity[1] += (self.position[1] - b.position[1]) * 0.05
+            vx += spx * 0.05
+            vy += spy * 0.05
 
         # Cap speed
-        speed = math.hypot(*self.velocity)
-        if speed > MAX_SPEED:
-            self.velocity[0] = self.velocity[0] / speed * MAX_SPEED
-            self.velocity[1] = self.velocity[1] / speed * MAX_SPEED
+        speed_sq = vx * vx + vy * vy
+        if speed_sq > MAX_SPEED_SQ:
+            scale = MAX_SPEED / math.sqrt(speed_sq)
+            vx *= scale
+            vy *= scale
 
-        # Update position
-        self.position[0] += self.velocity[0]
-        self.position[1] += self.velocity[1]
+        # Update position, wrapping around screen edges
+        px = (px + vx) % WIDTH
+        py = (py + vy) % HEIGHT
 
-        # Wrap around screen edges
-        self.position[0] %= WIDTH
-        self.position[1] %= HEIGHT
+        # Write the locals back once
+        self.velocity[0], self.velocity[1] = vx, vy
+        self.position[0], self.position[1] = px, py
 
         # Heal allies if medic (checked after position update for accurate distance)
-        self.heal_ally(all_boids)
+        self.heal_ally(grid)
 
-    def handle_patrol(self, all_boids, squad_size):
+    def handle_patrol(self, enemies, squad_size):
         """Behavior when in PATROL state."""
         # Leader patrol logic
         if self.is_leader:
             if self.waypoints:
                 target = self.waypoints[self.current_wp]
-                dx, dy = target[0] - self.position[0], target[1] - self.position[1]
-                if distance(self.position, target) < 10: # Reached waypoint
+                dx, dy = wrap_delta(target[0], self.position[0], WIDTH), wrap_delta(target[1], self.position[1], HEIGHT)
+                if dx * dx + dy * dy < WAYPOINT_SQ: # Reached waypoint
                     self.current_wp = (self.current_wp + 1) % len(self.waypoints)
                 else:
                     self.velocity[0] += 0.05 * dx
@@ -233,27 +343,40 @@ class Boid:
                 self.formation_offset = get_formation_offset(self.index_in_squad, FORMATION_MODE, squad_size)
                 target = [self.leader_ref.position[0] + self.formation_offset[0],
                           self.leader_ref.position[1] + self.formation_offset[1]]
-                dx, dy = target[0] - self.position[0], target[1] - self.position[1]
+                dx, dy = wrap_delta(target[0], self.position[0], WIDTH), wrap_delta(target[1], self.position[1], HEIGHT)
                 self.velocity[0] += 0.04 * dx
                 self.velocity[1] += 0.04 * dy
             else: # If leader is dead, the follower might become rogue or seek a new leader
                 self.leader_ref = None # No leader, so just wander or try to find a new one
 
-        # Transition to ENGAGE if an enemy is detected
-        potential_enemies = [b for b in all_boids if b.is_enemy != self.is_enemy and b.health > 0]
-        enemies_in_detection_range = [b for b in potential_enemies if distance(self.position, b.position) < self.detection_range]
-
-        if enemies_in_detection_range:
-            self.target_enemy = min(enemies_in_detection_range, key=lambda e: distance(self.position, e.position))
+        # Transition to ENGAGE if an enemy is detected: one pass over the opposing
+        # side's list (detection range spans most of the grid, so a ring lookup
+        # costs more than the scan), tracking the closest enemy as we go
+        px, py = self.position
+        closest = None
+        closest_d2 = DETECTION_RANGE_SQ
+        for b in enemies:
+            if b.health <= 0:
+                continue
+            dx, dy = wrap_delta(b.position[0], px, WIDTH), wrap_delta(b.position[1], py, HEIGHT)
+            d2 = dx * dx + dy * dy
+            if d2 < closest_d2:
+                closest_d2 = d2
+                closest = b
+
+        if closest:
+            self.target_enemy = closest
             self.state = 'ENGAGE'
             self.attacking = True # Set attacking flag
 
-    def handle_engage(self, all_boids):
+    def handle_engage(self):
         """Behavior when in ENGAGE state."""
         if self.target_enemy and self.target_enemy.health > 0:
             # Move towards target if out of firing range, or maintain distance
-            if distance(self.position, self.target_enemy.position) > self.firing_range * 0.8:
-                dx, dy = self.target_enemy.position[0] - self.position[0], self.target_enemy.position[1] - self.position[1]
+            target_dsq = dist_sq(self.position, self.target_enemy.position)
+            if target_dsq > FIRING_RANGE_SQ * 0.64: # Outside 80% of firing range
+                dx = wrap_delta(self.target_enemy.position[0], self.position[0], WIDTH)
+                dy = wrap_delta(self.target_enemy.position[1], self.position[1], HEIGHT)
                 self.velocity[0] += 0.05 * dx
                 self.velocity[1] += 0.05 * dy
             else: # When in firing range, slow down to aim and fire
@@ -261,7 +384,7 @@ class Boid:
                 self.velocity[1] *= 0.9
 
             # Fire projectiles if cooldown is ready and target is in range
-            if self.projectile_cooldown == 0 and distance(self.position, self.target_enemy.position) <= self.firing_range:
+            if self.projectile_cooldown == 0 and target_dsq <= FIRING_RANGE_SQ:
                 projectiles.append(Projectile(self.position, self.target_enemy))
                 self.projectile_cooldown = 60 # 1 second cooldown (60 frames)
         else:
@@ -274,18 +397,20 @@ class Boid:
         if self.health < 30 and not self.is_enemy: # Only player boids might evade
             self.state = 'EVADE'
 
-    def handle_evade(self, all_boids):
+    def handle_evade(self, enemies):
         """Behavior when in EVADE state."""
-        threats = [b for b in all_boids if b.is_enemy != self.is_enemy and b.health > 0 and distance(self.position, b.position) < self.detection_range * 1.5]
+        # 1.5x detection range spans nearly the whole field, so scan the opposing side's list instead of the grid
+        threats = [b for b in enemies if b.health > 0 and dist_sq(self.position, b.position) < DETECTION_RANGE_SQ * 2.25] # 1.5x detection range
         if threats:
             # Move away from the closest threat
-            closest_threat = min(threats, key=lambda t: distance(self.position, t.position))
-            dx, dy = self.position[0] - closest_threat.position[0], self.position[1] - closest_threat.position[1]
+            closest_threat = min(threats, key=lambda t: dist_sq(self.position, t.position))
+            dx = wrap_delta(self.position[0], closest_threat.position[0], WIDTH)
+            dy = wrap_delta(self.position[1], closest_threat.position[1], HEIGHT)
             # Boost velocity away from threat
             self.velocity[0] += dx * 0.1
             self.velocity[1] += dy * 0.1
             # Ensure a minimum speed when evading
-            speed = math.hypot(*self.velocity)
+            speed = math.sqrt(self.velocity[0] * self.velocity[0] + self.velocity[1] * self.velocity[1])
             if speed < MAX_SPEED / 2: # Keep moving
                 self.velocity[0] = self.velocity[0] / speed * (MAX_SPEED / 2) if speed > 0 else (random.uniform(-1, 1) * MAX_SPEED / 2)
                 self.velocity[1] = self.velocity[1] / speed * (MAX_SPEED / 2) if speed > 0 else (random.uniform(-1, 1) * MAX_SPEED / 2)
@@ -298,34 +423,34 @@ class Boid:
                 self.state = 'PATROL' # For now, just go back to patrol
 
     def draw(self, screen):
-        """Draws the boid on the screen."""
+        """Draws the boid on the screen and returns the Rect covering everything drawn."""
         if self.health <= 0:
-            return
+            return None
+
+        x, y = int(self.position[0]), int(self.position[1])
 
         # Determine color based on role/type
         color = PURPLE if self.is_enemy else (YELLOW if self.is_medic else COLORS[self.squad_id % len(COLORS)])
-        pygame.draw.circle(screen, color, (int(self.position[0]), int(self.position[1])), BOID_RADIUS)
+        rect = screen.blit(BODY_SURFS[color], (x - BOID_RADIUS, y - BOID_RADIUS))
 
-        # Draw label
-        label = FONT.render(self.label, True, WHITE)
-        screen.blit(label, (int(self.position[0]) + 10, int(self.position[1]) - 10))
+        # Draw label (cached by text, since labels can be renamed after creation)
+        rect.union_ip(screen.blit(render_label(self.label), (x + 10, y - 10)))
 
         # Draw health bar
-        health_bar_length = 30
         health_ratio = self.health / 100
-        pygame.draw.rect(screen, RED, (self.position[0] - 15, self.position[1] - 15, health_bar_length, 4))
-        pygame.draw.rect(screen, GREEN, (self.position[0] - 15, self.position[1] - 15, health_bar_length * health_ratio, 4))
+        rect.union_ip(screen.blit(RED_BAR, (x - 15, y - 15)))
+        pygame.draw.rect(screen, GREEN, (x - 15, y - 15, HEALTH_BAR_LENGTH * health_ratio, 4))
 
         # Draw special indicators
         if self.is_leader:
-            pygame.draw.circle(screen, WHITE, (int(self.position[0]), int(self.position[1])), BOID_RADIUS + 2, 1)
+            rect.union_ip(screen.blit(LEADER_RING, (x - BOID_RADIUS - 2, y - BOID_RADIUS - 2)))
         if self.shielded:
-            pygame.draw.circle(screen, BLUE, (int(self.position[0]), int(self.position[1])), BOID_RADIUS + 4, 1)
+            rect.union_ip(screen.blit(SHIELD_RING, (x - BOID_RADIUS - 4, y - BOID_RADIUS - 4)))
         if self.state == 'ENGAGE':
-             pygame.draw.circle(screen, ORANGE, (int(self.position[0]), int(self.position[1])), BOID_RADIUS + 6, 1) # Orange border for attacking
+            rect.union_ip(screen.blit(ENGAGE_RING, (x - BOID_RADIUS - 6, y - BOID_RADIUS - 6))) # Orange border for attacking
         if self.is_medic: # Additional visual for medic
-            pygame.draw.line(screen, WHITE, (self.position[0] - 5, self.position[1]), (self.position[0] + 5, self.position[1]), 1)
-            pygame.draw.line(screen, WHITE, (self.position[0], self.position[1] - 5), (self.position[0], self.position[1] + 5), 1)
+            rect.union_ip(screen.blit(MEDIC_CROSS, (x - 5, y - 5)))
+        return rect
 
 # --- Game Initialization ---
 patrol_zones = []
@@ -336,6 +461,9 @@ for i in range(NUM_SQUADS):
 boids = []          # List to hold all boids (player and enemy)
 pings = []          # List to hold active pings
 projectiles = []    # List to hold active projectiles
+grid = collections.defaultdict(list) # Spatial grid of boids, rebuilt every frame
+COMPACT_INTERVAL = 60 # Frames between sweeps of dead boids and spent projectiles/pings
+COMPACT_MIN_DEAD = 8  # Dead entries a list must hold before it is swept early
 
 # --- Create Player Squads ---
 for squad_id in range(NUM_SQUADS):
@@ -383,33 +511,110 @@ for i in range(NUM_ENEMY_SQUADS):
         enemy_follower.leader_ref = enemy_leader # Assign leader
         boids.append(enemy_follower)
 
+# --- Simulation Step ---
+frame_count = 0
+
+def step_simulation():
+    """Advances every boid, projectile and ping by one frame."""
+    global boids, projectiles, pings, frame_count
+
+    # Dead boids and inactive projectiles/pings stay in their lists and are skipped,
+    # the lists are only compacted periodically (see the end of the frame)
+    frame_count += 1
+    dead_boids = spent_projectiles = spent_pings = 0
+
+    # Rebuild the spatial grid used for neighbor queries, and partition living
+    # boids by side once, instead of each boid filtering the full list
+    grid.clear()
+    player_alive = []
+    enemy_alive = []
+    for b in boids:
+        if b.health <= 0:
+            dead_boids += 1
+            continue
+        grid[grid_cell(b.position)].append(b)
+        (enemy_alive if b.is_enemy else player_alive).append(b)
+
+    # Update boids. Flocking is staggered: each follower flocks only on frames
+    # matching its flock_parity, while leaders flock every frame
+    frame_parity = frame_count & 1
+    for b in boids:
+        if b.health <= 0:
+            continue
+        # Pass the grid to update for flocking, targeting, healing, etc.
+        # Pass BOIDS_PER_SQUAD for formation calculation, though this could be more dynamic
+        # Pass the per-side lists for scans that cover most of the field
+        b.update(grid, BOIDS_PER_SQUAD, player_alive, enemy_alive,
+                 flock=b.is_leader or b.flock_parity == frame_parity)
+
+    # Update projectiles
+    for p in projectiles:
+        if not p.active:
+            spent_projectiles += 1
+            continue
+        p.update()
+
+    # Update pings
+    for ping in pings:
+        if not ping.active:
+            spent_pings += 1
+            continue
+        ping.update()
+
+    # Compact the lists every COMPACT_INTERVAL frames, or sooner once a quarter of one
+    # (and at least COMPACT_MIN_DEAD entries) is dead, so small lists wait for the interval
+    compact_due = frame_count % COMPACT_INTERVAL == 0
+    if compact_due or dead_boids > max(len(boids) // 4, COMPACT_MIN_DEAD):
+        boids = [b for b in boids if b.health > 0]
+    if compact_due or spent_projectiles > max(len(projectiles) // 4, COMPACT_MIN_DEAD):
+        projectiles = [p for p in projectiles if p.active]
+    if compact_due or spent_pings > max(len(pings) // 4, COMPACT_MIN_DEAD):
+        pings = [p for p in pings if p.active]
+
 # --- Game Loop ---
 running = True
 clock = pygame.time.Clock()
+BACKGROUND = (10, 10, 10) # Dark background
+prev_rects = []           # Screen areas drawn last frame, erased and refreshed this frame
+
+screen.fill(BACKGROUND)
+pygame.display.flip()
 
 while running:
-    screen.fill((10, 10, 10)) # Dark background
+    # Erase only what was drawn last frame instead of clearing the whole screen
+    for r in prev_rects:
+        screen.fill(BACKGROUND, r)
+    dirty_rects = []
+    full_redraw = False # Set when the window was exposed and must be repainted whole
 
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             running = False
+        if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            full_redraw = True
         if event.type == pygame.MOUSEBUTTONDOWN:
             if event.button == 1: # Left click
-                # Check if a player leader was clicked to activate shield
+                # Check if a player leader was clicked to activate shield.
+                # Clicks are in screen space, so distances here don't wrap around the edges
                 for b in boids:
-                    if b.is_leader and not b.is_enemy and distance(b.position, event.pos) < BOID_RADIUS * 2:
+                    if not (b.is_leader and not b.is_enemy and b.health > 0):
+                        continue
+                    dx, dy = b.position[0] - event.pos[0], b.position[1] - event.pos[1]
+                    if dx * dx + dy * dy < CLICK_RADIUS_SQ:
                         b.apply_shield(boids) # Pass all boids for shield application
                         pings.append(Ping(b.position)) # Visual ping for shield activation
+                        break # Only one leader can be clicked
             if event.button == 3: # Right click
                 # Right-click to set a new waypoint for the closest player leader
                 mouse_pos = list(event.pos)
                 closest_leader = None
-                min_dist = float('inf')
+                best_d2 = float('inf')
                 for b in boids:
-                    if b.is_leader and not b.is_enemy:
-                        dist = distance(b.position, mouse_pos)
-                        if dist < min_dist:
-                            min_dist = dist
+                    if b.is_leader and not b.is_enemy and b.health > 0:
+                        dx, dy = b.position[0] - mouse_pos[0], b.position[1] - mouse_pos[1]
+                        d2 = dx * dx + dy * dy # Screen space, not wrapped
+                        if d2 < best_d2:
+                            best_d2 = d2
                             closest_leader = b
                 if closest_leader:
                     closest_leader.waypoints = [mouse_pos] # Set new single waypoint
@@ -418,30 +623,21 @@ while running:
 
     # --- Update and Draw All Game Objects ---
 
-    # Filter out dead boids and inactive projectiles/pings
-    boids = [b for b in boids if b.health > 0]
-    projectiles = [p for p in projectiles if p.active]
-    pings = [p for p in pings if p.active]
-
-    # Update and draw boids
-    for b in boids:
-        # Pass all boids list to update for flocking, targeting, healing, etc.
-        # Pass BOIDS_PER_SQUAD for formation calculation, though this could be more dynamic
-        b.update(boids, BOIDS_PER_SQUAD)
-        b.draw(screen)
-
-    # Update and draw projectiles
-    for p in projectiles:
-        p.update()
-        p.draw(screen)
-
-    # Update and draw pings
-    for ping in pings:
-        ping.update()
-        ping.draw(screen)
-
-    # Refresh display
-    pygame.display.flip()
+    step_simulation()
+
+    # Draw everything
+    for entities in (boids, projectiles, pings):
+        for entity in entities:
+            rect = entity.draw(screen)
+            if rect:
+                dirty_rects.append(rect)
+
+    # Refresh only the areas erased or drawn this frame, or the whole window after an expose
+    if full_redraw:
+        pygame.display.flip()
+    else:
+        pygame.display.update(prev_rects + dirty_rects)
+    prev_rects = dirty_rects
 
     # Cap frame rate
     clock.tick(60)